@@ -9,7 +9,7 @@ class CommonSegAsm(CommonSegCodeSubsegment):
     def out_path(self) -> Optional[Path]:
         return options.get_asm_path() / self.dir / f"{self.name}.s"
 
-    def scan(self, rom_bytes: bytes):
+    def scan(self, rom_bytes: memoryview):
         if (
             self.rom_start != "auto"
             and self.rom_end != "auto"
@@ -20,7 +20,7 @@ class CommonSegAsm(CommonSegCodeSubsegment):
     def get_file_header(self):
         return []
 
-    def split(self, rom_bytes: bytes):
+    def split(self, rom_bytes: memoryview):
         if not self.rom_start == self.rom_end:
             out_path = self.out_path()
             if out_path:
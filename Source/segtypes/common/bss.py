@@ -6,10 +6,10 @@ class CommonSegBss(CommonSegData):
     def get_linker_section(self) -> str:
         return ".bss"
 
-    def scan(self, rom_bytes: bytes):
+    def scan(self, rom_bytes: memoryview):
         pass
 
-    def split(self, rom_bytes: bytes):
+    def split(self, rom_bytes: memoryview):
         pass
 
     def get_linker_entries(self):
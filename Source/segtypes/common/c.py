@@ -98,7 +98,7 @@ class CommonSegC(CommonSegCodeSubsegment):
     def out_path(self) -> Optional[Path]:
         return options.get_src_path() / self.dir / f"{self.name}.c"
 
-    def scan(self, rom_bytes: bytes):
+    def scan(self, rom_bytes: memoryview):
         if (
             self.rom_start is not None
             and self.rom_end is not None
@@ -116,7 +116,7 @@ class CommonSegC(CommonSegCodeSubsegment):
 
             self.scan_code(rom_bytes)
 
-    def split(self, rom_bytes: bytes):
+    def split(self, rom_bytes: memoryview):
         if not self.rom_start == self.rom_end:
 
             asm_out_dir = options.get_nonmatchings_path() / self.dir
@@ -105,7 +105,7 @@ class CommonSegCodeSubsegment(Segment):
         insns: List[CsInsn] = [
             insn
             for insn in CommonSegCodeSubsegment.md.disasm(
-                rom_bytes[self.rom_start : self.rom_end], self.vram_start
+                bytes(rom_bytes[self.rom_start : self.rom_end]), self.vram_start
             )
         ]
 
@@ -182,6 +182,7 @@ class CommonSegCodeSubsegment(Segment):
                 elif opcode == 33:
                     mnemonic = "addu"
                 else:
+                    log.flush_dots()
                     print("INVALID INSTRUCTION " + str(insn), opcode)
             elif mnemonic == "jal":
                 jal_addr = int(op_str, 0)
@@ -608,6 +609,8 @@ class CommonSegCodeSubsegment(Segment):
                     ):
                         new_file_addr = func.insns[-1].rom_addr + 4
                         if (new_file_addr % 16) == 0:
+                            # Keep these after the progress dots already logged
+                            log.flush_dots()
                             if not self.parent.reported_file_split:
                                 self.parent.reported_file_split = True
                                 print(
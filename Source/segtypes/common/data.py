@@ -20,7 +20,7 @@ class CommonSegData(CommonSegCodeSubsegment, CommonSegGroup):
             # ASM
             return options.get_data_path() / self.dir / f"{self.name}.{self.type}.s"
 
-    def scan(self, rom_bytes: bytes):
+    def scan(self, rom_bytes: memoryview):
         CommonSegGroup.scan(self, rom_bytes)
 
         if super().should_scan():
@@ -28,7 +28,7 @@ class CommonSegData(CommonSegCodeSubsegment, CommonSegGroup):
         else:
             self.file_text = None
 
-    def split(self, rom_bytes: bytes):
+    def split(self, rom_bytes: memoryview):
         CommonSegGroup.split(self, rom_bytes)
 
         if not self.type.startswith(".") and self.file_text:
@@ -162,7 +162,7 @@ class CommonSegData(CommonSegCodeSubsegment, CommonSegGroup):
             return False
 
         try:
-            chars = bytes.decode("EUC-JP")
+            chars = str(bytes, "EUC-JP")
         except:
             return False
 
@@ -266,7 +266,7 @@ class CommonSegData(CommonSegCodeSubsegment, CommonSegGroup):
 
         if sym_type == "ascii":
             try:
-                ascii_str = sym_bytes.decode("EUC-JP")
+                ascii_str = str(sym_bytes, "EUC-JP")
                 # ascii_str = ascii_str.rstrip("\x00")
                 ascii_str = ascii_str.replace("\\", "\\\\")  # escape back slashes
                 ascii_str = ascii_str.replace('"', '\\"')  # escape quotes
@@ -10,7 +10,7 @@ class CommonSegHeader(CommonSegment):
     @staticmethod
     def get_line(typ, data, comment):
         if typ == "ascii":
-            text = data.decode("ASCII").strip()
+            text = str(data, "ASCII").strip()
             text = text.replace("\x00", "\\0")  # escape NUL chars
             dstr = '"' + text + '"'
         else:  # .word, .byte
@@ -51,7 +51,7 @@ class N64SegVtx(CommonSegCodeSubsegment):
     def out_path(self) -> Path:
         return options.get_asset_path() / self.dir / f"{self.name}.vtx.inc.c"
 
-    def scan(self, rom_bytes: bytes):
+    def scan(self, rom_bytes: memoryview):
         self.file_text = self.disassemble_data(rom_bytes)
 
     def disassemble_data(self, rom_bytes):
@@ -84,7 +84,7 @@ class N64SegVtx(CommonSegCodeSubsegment):
         lines.append("")
         return "\n".join(lines)
 
-    def split(self, rom_bytes: bytes):
+    def split(self, rom_bytes: memoryview):
         if self.file_text and self.out_path():
             self.out_path().parent.mkdir(parents=True, exist_ok=True)
 
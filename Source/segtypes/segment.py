@@ -15,6 +15,10 @@ if TYPE_CHECKING:
 
 RomAddr = Union[int, str]
 
+# Segment classes already looked up by get_class_for_type, keyed by
+# (platform, extensions path, segment type) since the lookup depends on both options
+segment_class_cache: Dict[tuple, Type["Segment"]] = {}
+
 
 def parse_segment_vram(segment: Union[dict, list]) -> Optional[int]:
     if isinstance(segment, dict) and "vram" in segment:
@@ -42,6 +46,10 @@ class Segment:
 
     @staticmethod
     def get_class_for_type(seg_type):
+        key = (options.get_platform(), options.get_extensions_path(), seg_type)
+        if key in segment_class_cache:
+            return segment_class_cache[key]
+
         # so .data loads SegData, for example
         if seg_type.startswith("."):
             seg_type = seg_type[1:]
@@ -50,6 +58,8 @@ class Segment:
         if segment_class == None:
             # Look in extensions
             segment_class = Segment.get_extension_segment_class(seg_type)
+
+        segment_class_cache[key] = segment_class
         return segment_class
 
     @staticmethod
@@ -178,6 +188,10 @@ class Segment:
         self.warnings: List[str] = []
         self.did_run = False
 
+        # Filled in once per run by split.py when --use-cache is given
+        self.cache_id: Optional[str] = None
+        self.cache_key: Optional[bytes] = None
+
         if isinstance(self.rom_start, int) and isinstance(self.rom_end, int):
             if self.rom_start > self.rom_end:
                 log.error(
@@ -329,10 +343,10 @@ class Segment:
     def should_split(self) -> bool:
         return self.extract and options.mode_active(self.type)
 
-    def scan(self, rom_bytes: bytes):
+    def scan(self, rom_bytes: memoryview):
         pass
 
-    def split(self, rom_bytes: bytes):
+    def split(self, rom_bytes: memoryview):
         pass
 
     def cache(self):
@@ -1,21 +1,34 @@
 #! /usr/bin/env python3
 
 import hashlib
+from bisect import bisect_left
+from collections import defaultdict
+from operator import itemgetter
 from typing import Dict, List, Union, Set, Any
 import argparse
-import pylibyaml
+import os
 import yaml
 import pickle
+from pathlib import Path
 from colorama import Style, Fore
 from segtypes.segment import Segment
 from segtypes.linker_entry import LinkerWriter, to_cname
 from util import log
 from util import options
 from util import symbols
+from util.symbols import Symbol
 from util import palettes
 
+try:
+    from yaml import CSafeLoader as SafeLoader
+except ImportError:
+    from yaml import SafeLoader  # type: ignore
+
 VERSION = "0.8.0.0"
 
+# Size of the blocks the target binary and the cache are read and written in
+IO_BLOCK_SIZE = 1 << 20
+
 parser = argparse.ArgumentParser(
     description="Split a rom given a rom, a config, and output directory"
 )
@@ -25,26 +38,38 @@ parser.add_argument("--basedir", help="a directory in which to extract the rom")
 parser.add_argument("--modes", nargs="+", default="all")
 parser.add_argument("--verbose", action="store_true", help="Enable debug logging")
 parser.add_argument(
-    "--use-cache", action="store_true", help="Only split changed segments in config"
+    "--use-cache",
+    action="store_true",
+    help="Only split changed segments in config, and cache the parsed config in $XDG_CACHE_HOME/splat (~/.cache/splat by default)",
 )
 
 linker_writer: LinkerWriter
 config: Dict[str, Any]
 
 
+# Units for fmt_size, largest first
+SIZE_UNITS = [(1_000_000, "MB"), (1_000, "KB")]
+
+
 def fmt_size(size):
-    if size > 1000000:
-        return str(size // 1000000) + " MB"
-    elif size > 1000:
-        return str(size // 1000) + " KB"
-    else:
-        return str(size) + " B"
+    for unit_size, suffix in SIZE_UNITS:
+        if size > unit_size:
+            return f"{size // unit_size} {suffix}"
+    return f"{size} B"
+
+
+# Compact stand-in for a value that is compared between runs, such as a segment's cache()
+def cache_digest(obj) -> bytes:
+    return hashlib.blake2b(repr(obj).encode(), digest_size=16).digest()
 
 
 def initialize_segments(config_segments: Union[dict, list]) -> List[Segment]:
     seen_segment_names: Set[str] = set()
     ret = []
 
+    # Each start is both the start of one segment and the end of the previous one
+    starts = [Segment.parse_segment_start(seg_yaml) for seg_yaml in config_segments]
+
     for i, seg_yaml in enumerate(config_segments):
         # rompos marker
         if isinstance(seg_yaml, list) and len(seg_yaml) == 1:
@@ -54,8 +79,8 @@ def initialize_segments(config_segments: Union[dict, list]) -> List[Segment]:
 
         segment_class = Segment.get_class_for_type(seg_type)
 
-        this_start = Segment.parse_segment_start(seg_yaml)
-        next_start = Segment.parse_segment_start(config_segments[i + 1])
+        this_start = starts[i]
+        next_start = starts[i + 1]
 
         segment: Segment = Segment.from_yaml(
             segment_class, seg_yaml, this_start, next_start
@@ -73,57 +98,69 @@ def initialize_segments(config_segments: Union[dict, list]) -> List[Segment]:
 
 
 def get_segment_symbols(segment, all_segments):
-    seg_syms = {}
-    other_syms = {}
-
-    for symbol in symbols.all_symbols:
-        if symbols.is_symbol_isolated(symbol, all_segments) and not symbol.rom:
-            if segment.contains_vram(symbol.vram_start):
-                if symbol.vram_start not in seg_syms:
-                    seg_syms[symbol.vram_start] = []
-                seg_syms[symbol.vram_start].append(symbol)
-            else:
-                if symbol.vram_start not in other_syms:
-                    other_syms[symbol.vram_start] = []
-                other_syms[symbol.vram_start].append(symbol)
+    symbols.update_symbol_index(all_segments)
+
+    # Isolated symbols without a rom address are matched on vram, the rest on rom
+    in_segment = []
+    if segment.vram_start is not None and segment.vram_end is not None:
+        index = symbols.isolated_vram_index
+        lo = bisect_left(index, (segment.vram_start,))
+        hi = bisect_left(index, (segment.vram_end,))
+        in_segment += index[lo:hi]
+    if isinstance(segment.rom_start, int) and isinstance(segment.rom_end, int):
+        index = symbols.rom_index
+        lo = bisect_left(index, (segment.rom_start,))
+        hi = bisect_left(index, (segment.rom_end,))
+        in_segment += index[lo:hi]
+
+    # Restore the order of all_symbols
+    in_segment.sort(key=itemgetter(1))
+
+    seg_syms: Dict[int, List[Symbol]] = defaultdict(list)
+    for _, _, symbol in in_segment:
+        seg_syms[symbol.vram_start].append(symbol)
+
+    seg_sym_set = {symbol for _, _, symbol in in_segment}
+    other_syms: Dict[int, List[Symbol]] = {}
+    for vram, group in symbols.vram_groups.items():
+        if vram not in seg_syms:
+            other_syms[vram] = group.copy()
         else:
-            if symbol.rom and segment.contains_rom(symbol.rom):
-                if symbol.vram_start not in seg_syms:
-                    seg_syms[symbol.vram_start] = []
-                seg_syms[symbol.vram_start].append(symbol)
-            else:
-                if symbol.vram_start not in other_syms:
-                    other_syms[symbol.vram_start] = []
-                other_syms[symbol.vram_start].append(symbol)
+            rest = [symbol for symbol in group if symbol not in seg_sym_set]
+            if rest:
+                other_syms[vram] = rest
 
-    return seg_syms, other_syms
+    return dict(seg_syms), other_syms
 
 
-def do_statistics(seg_sizes, rom_bytes, seg_split, seg_cached):
+# rest_size is the total size of all segments that aren't unknown bin files
+def do_statistics(seg_sizes, rest_size, rom_bytes, seg_split, seg_cached):
     unk_size = seg_sizes.get("unk", 0)
-    rest_size = 0
-    total_size = len(rom_bytes)
+    inv_total_size = 1.0 / len(rom_bytes)
 
-    for typ in seg_sizes:
-        if typ != "unk":
-            rest_size += seg_sizes[typ]
+    known_ratio = rest_size * inv_total_size
+    unk_ratio = unk_size * inv_total_size
 
-    known_ratio = rest_size / total_size
-    unk_ratio = unk_size / total_size
+    type_stats = [
+        (typ, size, size * inv_total_size)
+        for typ, size in seg_sizes.items()
+        if typ != "unk"
+    ]
 
     log.write(f"Split {fmt_size(rest_size)} ({known_ratio:.2%}) in defined segments")
-    for typ in seg_sizes:
-        if typ != "unk":
-            tmp_size = seg_sizes[typ]
-            tmp_ratio = tmp_size / total_size
-            log.write(
-                f"{typ:>20}: {fmt_size(tmp_size):>8} ({tmp_ratio:.2%}) {Fore.GREEN}{seg_split[typ]} split{Style.RESET_ALL}, {Style.DIM}{seg_cached[typ]} cached"
-            )
+    for typ, size, ratio in type_stats:
+        log.write(
+            f"{typ:>20}: {fmt_size(size):>8} ({ratio:.2%}) {Fore.GREEN}{seg_split[typ]} split{Style.RESET_ALL}, {Style.DIM}{seg_cached[typ]} cached"
+        )
     log.write(
         f"{'unknown':>20}: {fmt_size(unk_size):>8} ({unk_ratio:.2%}) from unknown bin files"
     )
 
 
+# Stands in for a key that is absent from a config (None is a valid yaml value)
+MISSING = object()
+
+
 def merge_configs(main_config, additional_config):
     # Merge rules are simple
     # For each key in the dictionary
@@ -131,38 +168,90 @@ def merge_configs(main_config, additional_config):
     # - If a dictionary then repeat merge on sub dictionary entries
     # - Else assume string or number and replace entry
 
-    for curkey in additional_config:
-        if curkey not in main_config:
-            main_config[curkey] = additional_config[curkey]
-        elif type(main_config[curkey]) != type(additional_config[curkey]):
-            log.error(f"Type for key {curkey} in configs does not match")
-        else:
-            # keys exist and match, see if a list to append
-            if type(main_config[curkey]) == list:
-                main_config[curkey] += additional_config[curkey]
-            elif type(main_config[curkey]) == dict:
+    # Sub dictionaries are merged in place from a work stack rather than recursively
+    stack = [(main_config, additional_config)]
+    while stack:
+        main_dict, additional_dict = stack.pop()
+
+        for curkey, value in additional_dict.items():
+            current = main_dict.get(curkey, MISSING)
+            if current is MISSING:
+                main_dict[curkey] = value
+            elif type(current) is not type(value):
+                log.error(f"Type for key {curkey} in configs does not match")
+            elif isinstance(current, list):
+                # keys exist and match, append to the list
+                current.extend(value)
+            elif isinstance(current, dict):
                 # need to merge sub areas
-                main_config[curkey] = merge_configs(
-                    main_config[curkey], additional_config[curkey]
-                )
+                stack.append((current, value))
             else:
                 # not a list or dictionary, must be a number or string, overwrite
-                main_config[curkey] = additional_config[curkey]
+                main_dict[curkey] = value
 
     return main_config
 
 
+# Writes "name = 0xADDR;" lines for the given symbols, skipping the file if there are none
+def write_symbol_list(path, to_write: List[Symbol]):
+    if len(to_write) > 0:
+        with open(path, "w", newline="\n") as f:
+            f.write(
+                "".join(
+                    f"{symbol.name} = 0x{symbol.vram_start:X};\n" for symbol in to_write
+                )
+            )
+
+
+def load_config(config_path, use_cache) -> Dict[str, Any]:
+    config_cache_path = None
+    config_stats = None
+
+    if use_cache:
+        # One cache file per set of config paths, holding the paths' modification
+        # times and sizes followed by the merged config
+        paths = [str(Path(entry).resolve()) for entry in config_path]
+        config_stats = [(st.st_mtime_ns, st.st_size) for st in map(os.stat, paths)]
+
+        try:
+            cache_dir = Path(os.environ.get("XDG_CACHE_HOME") or Path.home() / ".cache")
+            config_cache_path = (
+                cache_dir / "splat" / ("config-" + cache_digest(paths).hex() + ".pkl")
+            )
+
+            with config_cache_path.open("rb") as f:
+                if pickle.load(f) == config_stats:
+                    return pickle.load(f)
+        except Exception:
+            # Also covers there being no home directory to cache in, in which
+            # case config_cache_path stays None and nothing is written either
+            pass
+
+    config: Dict[str, Any] = {}
+    for entry in config_path:
+        with open(entry) as f:
+            additional_config = yaml.load(f.read(), Loader=SafeLoader)
+        config = merge_configs(config, additional_config)
+
+    if config_cache_path is not None:
+        try:
+            config_cache_path.parent.mkdir(parents=True, exist_ok=True)
+            with config_cache_path.open("wb") as f:
+                pickle.dump(config_stats, f, protocol=pickle.HIGHEST_PROTOCOL)
+                pickle.dump(config, f, protocol=pickle.HIGHEST_PROTOCOL)
+        except OSError:
+            pass
+
+    return config
+
+
 def main(config_path, base_dir, target_path, modes, verbose, use_cache=True):
     global config
 
     log.write(f"splat {VERSION}")
 
     # Load config
-    config = {}
-    for entry in config_path:
-        with open(entry) as f:
-            additional_config = yaml.load(f.read(), Loader=yaml.SafeLoader)
-        config = merge_configs(config, additional_config)
+    config = load_config(config_path, use_cache)
 
     options.initialize(config, config_path, base_dir, target_path)
     options.set("modes", modes)
@@ -170,45 +259,56 @@ def main(config_path, base_dir, target_path, modes, verbose, use_cache=True):
     if verbose:
         options.set("verbose", True)
 
+    # Read the target straight into a buffer of its exact size, hashing each block as it comes in.
+    # Segments are handed a read-only rom_view, so slicing it doesn't copy the underlying
+    # bytes and no segment can modify the rom the others see
+    sha1 = hashlib.sha1() if "sha1" in config else None
     with options.get_target_path().open("rb") as f2:
-        rom_bytes = f2.read()
-
-    if "sha1" in config:
-        sha1 = hashlib.sha1(rom_bytes).hexdigest()
+        rom_bytes = bytearray(os.fstat(f2.fileno()).st_size)
+        rom_view = memoryview(rom_bytes)
+        pos = 0
+        while n := f2.readinto(rom_view[pos : pos + IO_BLOCK_SIZE]):
+            if sha1 is not None:
+                sha1.update(rom_view[pos : pos + n])
+            pos += n
+    rom_view = rom_view.toreadonly()
+
+    if sha1 is not None:
         e_sha1 = config["sha1"].lower()
-        if e_sha1 != sha1:
-            log.error(f"sha1 mismatch: expected {e_sha1}, was {sha1}")
+        if e_sha1 != sha1.hexdigest():
+            log.error(f"sha1 mismatch: expected {e_sha1}, was {sha1.hexdigest()}")
 
     # Create main output dir
     options.get_base_path().mkdir(parents=True, exist_ok=True)
 
     processed_segments: List[Segment] = []
 
-    seg_sizes: Dict[str, int] = {}
-    seg_split: Dict[str, int] = {}
-    seg_cached: Dict[str, int] = {}
+    seg_sizes: Dict[str, int] = defaultdict(int)
+    seg_split: Dict[str, int] = defaultdict(int)
+    seg_cached: Dict[str, int] = defaultdict(int)
+    rest_size = 0
 
     # Load cache
+    options_digest = cache_digest(config.get("options"))
+    cache: Dict[str, bytes] = {}
+    # Only written back if a segment missed or there was no usable cache to begin with
+    cache_dirty = use_cache
     if use_cache:
         try:
-            with options.get_cache_path().open("rb") as f3:
-                cache = pickle.load(f3)
-
-            if verbose:
-                log.write(f"Loaded cache ({len(cache.keys())} items)")
+            with options.get_cache_path().open("rb", buffering=IO_BLOCK_SIZE) as f3:
+                # The options digest is pickled ahead of the entries so they
+                # don't need to be loaded at all if the options changed
+                if pickle.load(f3) == options_digest:
+                    cache = pickle.load(f3)
+                    cache_dirty = False
+
+                    if verbose:
+                        log.write(f"Loaded cache ({len(cache)} items)")
+                elif verbose:
+                    # invalidate entire cache if options change
+                    log.write("Options changed, invalidating cache")
         except Exception:
             cache = {}
-    else:
-        cache = {}
-
-    # invalidate entire cache if options change
-    if use_cache and cache.get("__options__") != config.get("options"):
-        if verbose:
-            log.write("Options changed, invalidating cache")
-
-        cache = {
-            "__options__": config.get("options"),
-        }
 
     # Initialize segments
     all_segments = initialize_segments(config["segments"])
@@ -223,22 +323,29 @@ def main(config_path, base_dir, target_path, modes, verbose, use_cache=True):
         palettes.initialize(all_segments)
 
     # Scan
+    # Segments are scanned one after another on purpose: scanning creates and marks
+    # symbols in symbols.all_symbols, and get_segment_symbols hands those to the
+    # segments scanned after it, so the order of this loop matters
     log.write("Starting scan")
     for segment in all_segments:
         typ = segment.type
         if segment.type == "bin" and segment.is_name_default():
             typ = "unk"
 
-        if typ not in seg_sizes:
-            seg_sizes[typ] = 0
-            seg_split[typ] = 0
-            seg_cached[typ] = 0
-        seg_sizes[typ] += 0 if segment.size is None else segment.size
+        size = 0 if segment.size is None else segment.size
+        seg_sizes[typ] += size
+        if typ != "unk":
+            rest_size += size
+
+        if use_cache:
+            # Computed once here and reused by the split below
+            segment.cache_id = segment.unique_id()
+            segment.cache_key = cache_digest(segment.cache())
 
         if segment.should_scan():
             # Check cache but don't write anything
             if use_cache:
-                if segment.cache() == cache.get(segment.unique_id()):
+                if segment.cache_key == cache.get(segment.cache_id):
                     continue
 
             if segment.needs_symbols:
@@ -249,7 +356,9 @@ def main(config_path, base_dir, target_path, modes, verbose, use_cache=True):
                 segment.given_ext_symbols = other_symbols
 
             segment.did_run = True
-            segment.scan(rom_bytes)
+            # Show the dots so far before work that may take a while
+            log.flush_dots()
+            segment.scan(rom_view)
 
             processed_segments.append(segment)
 
@@ -261,18 +370,18 @@ def main(config_path, base_dir, target_path, modes, verbose, use_cache=True):
     log.write("Starting split")
     for segment in all_segments:
         if use_cache:
-            cached = segment.cache()
-
-            if cached == cache.get(segment.unique_id()):
+            if segment.cache_key == cache.get(segment.cache_id):
                 # Cache hit
                 seg_cached[typ] += 1
                 continue
             else:
                 # Cache miss; split
-                cache[segment.unique_id()] = cached
+                cache[segment.cache_id] = segment.cache_key
+                cache_dirty = True
 
         if segment.should_split():
-            segment.split(rom_bytes)
+            log.flush_dots()
+            segment.split(rom_view)
 
         log.dot(status=segment.status())
 
@@ -287,35 +396,34 @@ def main(config_path, base_dir, target_path, modes, verbose, use_cache=True):
         # write elf_sections.txt - this only lists the generated sections in the elf, not subsections
         # that the elf combines into one section
         if options.get_create_elf_section_list_auto():
-            section_list = ""
-            for segment in all_segments:
-                section_list += "." + to_cname(segment.name) + "\n"
             with open(options.get_elf_section_list_path(), "w", newline="\n") as f:
-                f.write(section_list)
+                f.write(
+                    "".join(
+                        "." + to_cname(segment.name) + "\n" for segment in all_segments
+                    )
+                )
+
+    # Sort undefined symbols into functions and everything else in one pass
+    undefined_funcs: List[Symbol] = []
+    undefined_syms: List[Symbol] = []
+    if (
+        options.get_create_undefined_funcs_auto()
+        or options.get_create_undefined_syms_auto()
+    ):
+        for s in symbols.all_symbols:
+            if s.referenced and not s.defined and not s.dead:
+                if s.type == "func":
+                    undefined_funcs.append(s)
+                else:
+                    undefined_syms.append(s)
 
     # Write undefined_funcs_auto.txt
     if options.get_create_undefined_funcs_auto():
-        to_write = [
-            s
-            for s in symbols.all_symbols
-            if s.referenced and not s.defined and not s.dead and s.type == "func"
-        ]
-        if len(to_write) > 0:
-            with open(options.get_undefined_funcs_auto_path(), "w", newline="\n") as f:
-                for symbol in to_write:
-                    f.write(f"{symbol.name} = 0x{symbol.vram_start:X};\n")
+        write_symbol_list(options.get_undefined_funcs_auto_path(), undefined_funcs)
 
     # write undefined_syms_auto.txt
     if options.get_create_undefined_syms_auto():
-        to_write = [
-            s
-            for s in symbols.all_symbols
-            if s.referenced and not s.defined and not s.dead and not s.type == "func"
-        ]
-        if len(to_write) > 0:
-            with open(options.get_undefined_syms_auto_path(), "w", newline="\n") as f:
-                for symbol in to_write:
-                    f.write(f"{symbol.name} = 0x{symbol.vram_start:X};\n")
+        write_symbol_list(options.get_undefined_syms_auto_path(), undefined_syms)
 
     # print warnings during split
     for segment in all_segments:
@@ -330,14 +438,15 @@ def main(config_path, base_dir, target_path, modes, verbose, use_cache=True):
             log.write("")  # empty line
 
     # Statistics
-    do_statistics(seg_sizes, rom_bytes, seg_split, seg_cached)
+    do_statistics(seg_sizes, rest_size, rom_bytes, seg_split, seg_cached)
 
     # Save cache
-    if cache != {} and use_cache:
+    if cache_dirty:
         if verbose:
             log.write("Writing cache")
-        with open(options.get_cache_path(), "wb") as f4:
-            pickle.dump(cache, f4)
+        with open(options.get_cache_path(), "wb", buffering=IO_BLOCK_SIZE) as f4:
+            pickle.dump(options_digest, f4, protocol=pickle.HIGHEST_PROTOCOL)
+            pickle.dump(cache, f4, protocol=pickle.HIGHEST_PROTOCOL)
 
 
 if __name__ == "__main__":
@@ -1,17 +1,35 @@
+import atexit
 import sys
+import time
 from colorama import init, Fore, Style
-from typing import Optional
+from typing import List, Optional
 
+# This runs when util.log is first imported, before anything prints colored output,
+# so this is the one place colorama needs to be set up, Windows ANSI handling included
 init(autoreset=True)
 
 newline = True
 
 Status = Optional[str]
 
+# Dots are collected here and written out together, every DOT_FLUSH_COUNT dots or
+# DOT_FLUSH_INTERVAL seconds, whichever comes first, or before any other output.
+# The interval is only checked when a dot is added, so callers about to do slow
+# work should call flush_dots() first
+DOT_FLUSH_COUNT = 64
+DOT_FLUSH_INTERVAL = 0.1
+
+dot_buffer: List[str] = []
+dot_count = 0
+dot_status: Status = None
+last_dot_flush = 0.0
+
 
 def write(*args, status=None, **kwargs):
     global newline
 
+    flush_dots()
+
     if not newline:
         print("")
         newline = True
@@ -33,10 +51,43 @@ def parsing_error_preamble(path, line_num, line):
 
 def dot(status: Status = None):
     global newline
+    global dot_count
+    global dot_status
 
-    print(status_to_ansi(status) + ".", end="")
+    # Only emit color codes when the status differs from the previous dot
+    if dot_count == 0 or status != dot_status:
+        dot_buffer.append(Style.RESET_ALL + status_to_ansi(status))
+        dot_status = status
+
+    dot_buffer.append(".")
+    dot_count += 1
     newline = False
 
+    if (
+        dot_count >= DOT_FLUSH_COUNT
+        or time.monotonic() - last_dot_flush >= DOT_FLUSH_INTERVAL
+    ):
+        flush_dots()
+
+
+def flush_dots():
+    global dot_count
+    global last_dot_flush
+
+    if dot_count == 0:
+        return
+
+    sys.stdout.write("".join(dot_buffer))
+    sys.stdout.flush()
+
+    dot_buffer.clear()
+    dot_count = 0
+    last_dot_flush = time.monotonic()
+
+
+# Don't lose pending dots if splat exits early, e.g. with a traceback
+atexit.register(flush_dots)
+
 
 def status_to_ansi(status: Status):
     if status == "ok":
@@ -23,6 +23,8 @@ def setup_lib():
         )
         return True
     except Exception:
+        # Keep this after the progress dots already logged
+        log.flush_dots()
         print(f"Failed to load C library; falling back to python method")
         tried_loading = True
         return False
@@ -1,5 +1,6 @@
+from collections import defaultdict
 from dataclasses import dataclass
-from typing import Dict, List, Optional
+from typing import Dict, List, Optional, Tuple
 
 from capstone import CsInsn
 from util import options, log
@@ -8,6 +9,13 @@ all_symbols: "List[Symbol]" = []
 symbol_ranges: "List[Symbol]" = []
 sym_isolated_map: "Dict[Symbol, bool]" = {}
 
+# Indexes over all_symbols, brought up to date by update_symbol_index.
+# The sorted lists hold (address, position in all_symbols, symbol) entries
+isolated_vram_index: "List[Tuple[int, int, Symbol]]" = []
+rom_index: "List[Tuple[int, int, Symbol]]" = []
+vram_groups: "Dict[int, List[Symbol]]" = defaultdict(list)
+indexed_count = 0
+
 TRUEY_VALS = ["true", "on", "yes", "y"]
 FALSEY_VALS = ["false", "off", "no", "n"]
 
@@ -23,9 +31,17 @@ def is_falsey(str: str) -> bool:
 def initialize(all_segments):
     global all_symbols
     global symbol_ranges
+    global isolated_vram_index
+    global rom_index
+    global vram_groups
+    global indexed_count
 
     all_symbols = []
     symbol_ranges = []
+    isolated_vram_index = []
+    rom_index = []
+    vram_groups = defaultdict(list)
+    indexed_count = 0
 
     # Manual list of func name / addrs
     for path in options.get_symbol_addrs_paths():
@@ -134,6 +150,28 @@ def initialize(all_segments):
                         is_symbol_isolated(sym, all_segments)
 
 
+# Adds any symbols created since the last call to the indexes
+def update_symbol_index(all_segments):
+    global indexed_count
+
+    if indexed_count == len(all_symbols):
+        return
+
+    for i in range(indexed_count, len(all_symbols)):
+        sym = all_symbols[i]
+        vram_groups[sym.vram_start].append(sym)
+
+        if sym.rom:
+            rom_index.append((sym.rom, i, sym))
+        elif is_symbol_isolated(sym, all_segments):
+            isolated_vram_index.append((sym.vram_start, i, sym))
+
+    indexed_count = len(all_symbols)
+
+    isolated_vram_index.sort()
+    rom_index.sort()
+
+
 def is_symbol_isolated(symbol, all_segments):
     if symbol in sym_isolated_map:
         return sym_isolated_map[symbol]